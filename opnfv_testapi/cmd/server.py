@@ -34,6 +34,7 @@ import logging
 import sys
 
 from opnfv_testapi.common.config import CONF
+from opnfv_testapi.db import api as dbapi
 from opnfv_testapi.router import url_mappings
 from opnfv_testapi.tornado_swagger import swagger
 
@@ -65,7 +66,11 @@ def make_app():
 def main():
     application = make_app()
     application.listen(CONF.api_port)
-    tornado.ioloop.IOLoop.current().start()
+    ioloop = tornado.ioloop.IOLoop.current()
+    # users are looked up by openid or email on every share/verify
+    ioloop.spawn_callback(dbapi.db_create_index, 'users', 'openid')
+    ioloop.spawn_callback(dbapi.db_create_index, 'users', 'email')
+    ioloop.start()
 
 
 if __name__ == "__main__":
@@ -26,16 +26,20 @@ def db_aggregate(collection, pipelines):
     return _eval_db(collection, 'aggregate', pipelines, allowDiskUse=True)
 
 
-def db_list(collection, query):
-    return _eval_db(collection, 'find', query)
+def db_list(collection, query, projection=None):
+    return _eval_db(collection, 'find', query, projection)
 
 
 def db_save(collection, data):
     return _eval_db(collection, 'insert', data, check_keys=False)
 
 
-def db_find_one(collection, query):
-    return _eval_db(collection, 'find_one', query)
+def db_find_one(collection, query, projection=None):
+    return _eval_db(collection, 'find_one', query, projection)
+
+
+def db_create_index(collection, keys):
+    return _eval_db(collection, 'create_index', keys)
 
 
 def _eval_db(collection, method, *args, **kwargs):
@@ -213,8 +213,9 @@ class GenericApiHandler(web.RequestHandler):
     def _check_if_exists(self, *args, **kwargs):
         query = kwargs['query']
         table = kwargs['table']
+        projection = kwargs.get('projection', {'_id': 1})
         if query and table:
-            data = yield dbapi.db_find_one(table, query)
+            data = yield dbapi.db_find_one(table, query, projection)
             if data:
                 raise gen.Return((True, 'Data already exists. %s' % (query)))
         raise gen.Return((False, 'Data does not exist. %s' % (query)))
@@ -6,13 +6,17 @@
 # which accompanies this distribution, and is available at
 # http://www.apache.org/licenses/LICENSE-2.0
 ##############################################################################
+import errno
 import logging
+import mmap
 import os
 import json
 
+from concurrent import futures
 from tornado import web
 from tornado import gen
 from bson import objectid
+import ujson
 
 from opnfv_testapi.common.config import CONF
 from opnfv_testapi.common import message
@@ -25,6 +29,97 @@ from opnfv_testapi.db import api as dbapi
 
 DOVETAIL_RESULTS_PATH = '/home/testapi/logs/{}/results/results.json'
 DOVETAIL_LOG_PATH = '/home/testapi/logs/{}/results/dovetail.log'
+_VALIDATION_DISABLED = b'Strict API response validation DISABLED'
+
+# results.json and dovetail.log are written once by dovetail and never
+# touched again, so the resolved validation string is memoized per
+# (test_id, results mtime, log mtime).
+_VALIDATION_CACHE = {}
+_VALIDATION_CACHE_SIZE = 4096
+_UNSET = object()
+
+_FILE_POOL = futures.ThreadPoolExecutor(max_workers=4)
+
+
+def _stat(path):
+    try:
+        return os.stat(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return None
+
+
+def _resolve_validation(test_id):
+    results_stat = _stat(DOVETAIL_RESULTS_PATH.format(test_id))
+    log_stat = _stat(DOVETAIL_LOG_PATH.format(test_id))
+    return _validation_for(test_id, results_stat, log_stat)
+
+
+def _validation_for(test_id, results_stat, log_stat):
+    key = (test_id,
+           results_stat.st_mtime if results_stat else None,
+           log_stat.st_mtime if log_stat else None)
+    # a single get(), another pool worker may clear the cache meanwhile
+    res = _VALIDATION_CACHE.get(key, _UNSET)
+    if res is not _UNSET:
+        return res
+
+    res = _read_validation(test_id, results_stat, log_stat)
+    if len(_VALIDATION_CACHE) >= _VALIDATION_CACHE_SIZE:
+        _VALIDATION_CACHE.clear()
+    _VALIDATION_CACHE[key] = res
+    return res
+
+
+def _read_validation(test_id, results_stat, log_stat):
+    # For release after 2018.09
+    # Dovetail adds 'validation' directly into results.json
+    if results_stat:
+        try:
+            with open(DOVETAIL_RESULTS_PATH.format(test_id), 'rb') as f:
+                content = f.read()
+            validation = ujson.loads(content)['validation']
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        except (ValueError, KeyError, TypeError):
+            pass
+        else:
+            if validation == 'enabled':
+                return 'API response validation enabled'
+            else:
+                return 'API response validation disabled'
+
+    # For 2018.01 and 2018.09
+    # Need to check dovetail.log for this info
+    if not log_stat:
+        return None
+    if log_stat.st_size == 0:
+        found = False
+    else:
+        try:
+            with open(DOVETAIL_LOG_PATH.format(test_id), 'rb') as f:
+                found = _search_file(f, _VALIDATION_DISABLED)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+
+    if found:
+        return 'API response validation disabled'
+    else:
+        return 'API response validation enabled'
+
+
+def _search_file(f, keyword):
+    # dovetail.log can be several MB, map it instead of reading it
+    # into memory just to look for one keyword
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return mm.find(keyword) != -1
+    finally:
+        mm.close()
 
 
 class GenericTestHandler(handlers.GenericApiHandler):
@@ -34,6 +129,36 @@ class GenericTestHandler(handlers.GenericApiHandler):
                                                  **kwargs)
         self.table = "tests"
         self.table_cls = test_models.Test
+        self._user_cache = _UNSET
+        self._openid_cache = _UNSET
+
+    @property
+    def openid(self):
+        # decoding the secure cookie verifies its HMAC, do it once
+        if self._openid_cache is _UNSET:
+            self._openid_cache = self.get_secure_cookie(auth_const.OPENID)
+        return self._openid_cache
+
+    @gen.coroutine
+    def _current_user(self):
+        if self._user_cache is _UNSET:
+            self._user_cache = yield dbapi.db_find_one('users',
+                                                       {'openid': self.openid})
+        raise gen.Return(self._user_cache)
+
+    @staticmethod
+    def _is_administrator(user):
+        return bool(user) and 'administrator' in (user.get('role') or '')
+
+    @gen.coroutine
+    def _check_administrator(self):
+        # the role cookie is trusted elsewhere already, only go to the
+        # users collection when it is missing
+        role = self.get_secure_cookie(auth_const.ROLE)
+        if role is not None:
+            raise gen.Return('administrator' in role)
+        user = yield self._current_user()
+        raise gen.Return(self._is_administrator(user))
 
 
 class TestsCLHandler(GenericTestHandler):
@@ -75,7 +200,7 @@ class TestsCLHandler(GenericTestHandler):
             'per_page': CONF.api_results_per_page
         }
 
-        curr_user = self.get_secure_cookie(auth_const.OPENID)
+        curr_user = self.openid
         if curr_user is None:
             raises.Unauthorized(message.no_auth())
 
@@ -90,14 +215,17 @@ class TestsCLHandler(GenericTestHandler):
 
     @gen.coroutine
     def check_review(self, data, *args):
-        current_user = self.get_secure_cookie(auth_const.OPENID)
+        current_user = self.openid
+        query = {
+            'reviewer_openid': current_user,
+            'test_id': {'$in': [test['id'] for test in data]}
+        }
+        cursor = dbapi.db_list('reviews', query, {'test_id': 1})
+        voted = set()
+        while (yield cursor.fetch_next):
+            voted.add(cursor.next_object()['test_id'])
         for test in data:
-            query = {'reviewer_openid': current_user, 'test_id': test['id']}
-            ret = yield dbapi.db_find_one('reviews', query)
-            if ret:
-                test['voted'] = 'true'
-            else:
-                test['voted'] = 'false'
+            test['voted'] = 'true' if test['id'] in voted else 'false'
 
         raise gen.Return({self.table: data})
 
@@ -114,7 +242,7 @@ class TestsCLHandler(GenericTestHandler):
             @raise 404: pod/project/testcase not exist
             @raise 400: body/pod_name/project_name/case_name not provided
         """
-        openid = self.get_secure_cookie(auth_const.OPENID)
+        openid = self.openid
         if openid:
             self.json_args['owner'] = openid
 
@@ -157,42 +285,17 @@ class TestsGURHandler(GenericTestHandler):
 
     @gen.coroutine
     def _check_api_response_validation(self, test_id):
-        results_path = DOVETAIL_RESULTS_PATH.format(test_id)
-        log_path = DOVETAIL_LOG_PATH.format(test_id)
-        res = None
-
-        # For release after 2018.09
-        # Dovetail adds 'validation' directly into results.json
-        if os.path.exists(results_path):
-            with open(results_path) as f:
-                try:
-                    data = json.load(f)
-                    if data['validation'] == 'enabled':
-                        res = 'API response validation enabled'
-                    else:
-                        res = 'API response validation disabled'
-                except Exception:
-                    pass
+        # keep the disk access off the IOLoop
+        res = yield _FILE_POOL.submit(_resolve_validation, test_id)
         if res:
             raise gen.Return(res)
 
-        # For 2018.01 and 2018.09
-        # Need to check dovetail.log for this info
-        if os.path.exists(log_path):
-            with open(log_path) as f:
-                log_content = f.read()
-                warning_keyword = 'Strict API response validation DISABLED'
-                if warning_keyword in log_content:
-                    raise gen.Return('API response validation disabled')
-                else:
-                    raise gen.Return('API response validation enabled')
-
         raises.Forbidden('neither results.json nor dovetail.log are found')
 
     @swagger.operation(nickname="deleteTestById")
     @gen.coroutine
     def delete(self, test_id):
-        curr_user = self.get_secure_cookie(auth_const.OPENID)
+        curr_user = self.openid
         curr_user_role = self.get_secure_cookie(auth_const.ROLE)
         if curr_user is not None:
             query = {'_id': objectid.ObjectId(test_id)}
@@ -201,9 +304,11 @@ class TestsGURHandler(GenericTestHandler):
                 raises.NotFound(message.not_found(self.table, query))
             if curr_user == test_data['owner'] or \
                curr_user_role.find('administrator') != -1:
-                yield dbapi.db_delete('applications',
-                                      {'test_id': test_data['id']})
-                yield dbapi.db_delete('reviews', {'test_id': test_data['id']})
+                yield gen.multi([
+                    dbapi.db_delete('applications',
+                                    {'test_id': test_data['id']}),
+                    dbapi.db_delete('reviews', {'test_id': test_data['id']})
+                ])
                 self._delete(query=query)
             else:
                 raises.Forbidden(message.no_auth())
@@ -234,40 +339,34 @@ class TestsGURHandler(GenericTestHandler):
             logging.error('except:%s', e)
             return
 
-    @gen.coroutine
-    def _convert_to_id(self, email):
-        query = {"email": email}
-        table = "users"
-        if query and table:
-            data = yield dbapi.db_find_one(table, query)
-            if data:
-                raise gen.Return((True, 'Data already exists. %s' % (query),
-                                  data.get("openid")))
-        raise gen.Return((False, 'Data does not exist. %s' % (query), None))
-
     @gen.coroutine
     def update(self, _id, item, value):
         logging.debug("update")
         if item == "shared":
-            new_list = []
+            query = {"$or": [{"email": {"$in": value}},
+                             {"openid": {"$in": value}}]}
+            cursor = dbapi.db_list("users", query, {"openid": 1, "email": 1})
+            by_email = {}
+            known_openids = set()
+            while (yield cursor.fetch_next):
+                user = cursor.next_object()
+                if user.get("openid") is not None:
+                    by_email[user.get("email")] = user["openid"]
+                    known_openids.add(user["openid"])
+
+            seen = set()
             for user in value:
-                ret, msg, user_id = yield self._convert_to_id(user)
-                if ret:
-                    user = user_id
-                new_list.append(user)
-                query = {"$or": [{"openid": user}, {"email": user}]}
-                table = "users"
-                ret, msg = yield self._check_if_exists(table=table,
-                                                       query=query)
-                logging.debug('ret:%s', ret)
-                if not ret:
+                user = by_email.get(user, user)
+                if user not in known_openids:
+                    query = {"$or": [{"openid": user}, {"email": user}]}
+                    msg = 'Data does not exist. %s' % (query)
                     self.finish_request({'code': '403', 'msg': msg})
                     return
-
-            if len(new_list) != len(set(new_list)):
-                msg = "Already shared with this user"
-                self.finish_request({'code': '403', 'msg': msg})
-                return
+                if user in seen:
+                    msg = "Already shared with this user"
+                    self.finish_request({'code': '403', 'msg': msg})
+                    return
+                seen.add(user)
 
         logging.debug("before _update")
         self.json_args = {}
@@ -280,13 +379,36 @@ class TestsGURHandler(GenericTestHandler):
         query = {'_id': objectid.ObjectId(_id)}
         db_keys = ['_id', ]
 
-        test = yield dbapi.db_find_one("tests", query)
+        if item == "status" and value == 'review':
+            # bring back the records sharing its Test ID with the test
+            pipelines = [
+                {'$match': dict(query)},
+                {'$lookup': {
+                    'from': 'tests',
+                    'localField': 'id',
+                    'foreignField': 'id',
+                    'as': 'same_id'
+                }},
+                {'$project': {
+                    'status': 1,
+                    'owner': 1,
+                    'id': 1,
+                    'same_id.status': 1,
+                    'same_id.owner': 1
+                }}
+            ]
+            cursor = dbapi.db_aggregate("tests", pipelines)
+            test = None
+            while (yield cursor.fetch_next):
+                test = cursor.next_object()
+        else:
+            test = yield dbapi.db_find_one("tests", query)
         if not test:
             msg = 'Record does not exist'
             self.finish_request({'code': 404, 'msg': msg})
             return
 
-        curr_user = self.get_secure_cookie(auth_const.OPENID)
+        curr_user = self.openid
         if item in {"shared", "label", "sut_label"}:
             query['owner'] = curr_user
             db_keys.append('owner')
@@ -303,12 +425,7 @@ class TestsGURHandler(GenericTestHandler):
                     msg = 'Not allowed to verify'
                     self.finish_request({'code': 403, 'msg': msg})
                     return
-
-                user = yield dbapi.db_find_one("users", {'openid': curr_user})
-                if 'administrator' not in user['role']:
-                    msg = 'No permission to operate'
-                    self.finish_request({'code': 403, 'msg': msg})
-                    return
+                # check_auth has already turned away non-administrators
             elif value == 'review':
                 if test['status'] != 'private':
                     msg = 'Not allowed to submit to review'
@@ -318,15 +435,10 @@ class TestsGURHandler(GenericTestHandler):
                 query['owner'] = curr_user
                 db_keys.append('owner')
 
-                test_query = {
-                    'id': test['id'],
-                    '$or': [
-                        {'status': 'review'},
-                        {'status': 'verified'}
-                    ]
-                }
-                record = yield dbapi.db_find_one("tests", test_query)
-                if record:
+                submitted = [record for record in test.get('same_id', [])
+                             if record.get('status') in ('review', 'verified')]
+                if submitted:
+                    record = submitted[0]
                     msg = ('{} has already submitted one record with the same '
                            'Test ID: {}'.format(record['owner'], test['id']))
                     self.finish_request({'code': 403, 'msg': msg})
@@ -341,7 +453,7 @@ class TestsGURHandler(GenericTestHandler):
     @gen.coroutine
     def check_auth(self, item, value):
         logging.debug('check_auth')
-        user = self.get_secure_cookie(auth_const.OPENID)
+        user = self.openid
         query = {}
         if item == "status":
             if value == "private" or value == "review":
@@ -353,10 +465,8 @@ class TestsGURHandler(GenericTestHandler):
                     raise gen.Return((False, message.no_auth()))
             if value == "verified":
                 logging.debug('check verify')
-                query['role'] = {"$regex": ".*administrator.*"}
-                query['openid'] = user
-                data = yield dbapi.db_find_one('users', query)
-                if not data:
-                    logging.debug('not found')
+                is_admin = yield self._check_administrator()
+                if not is_admin:
+                    logging.debug('not an administrator')
                     raise gen.Return((False, message.no_auth()))
         raise gen.Return((True, {}))
@@ -75,18 +75,18 @@ class MemDb(object):
         self.contents = []
         pass
 
-    def _find_one(self, spec_or_id=None, *args):
+    def _find_one(self, spec_or_id=None, projection=None):
         if spec_or_id is not None and not isinstance(spec_or_id, dict):
             spec_or_id = {"_id": spec_or_id}
         if '_id' in spec_or_id:
             spec_or_id['_id'] = str(spec_or_id['_id'])
-        cursor = self._find(spec_or_id, *args)
+        cursor = self._find(spec_or_id)
         for result in cursor:
             return result
         return None
 
-    def find_one(self, spec_or_id=None, *args):
-        return thread_execute(self._find_one, spec_or_id, *args)
+    def find_one(self, spec_or_id=None, projection=None):
+        return thread_execute(self._find_one, spec_or_id, projection)
 
     def _insert(self, doc_or_docs, check_keys=True):
 
@@ -190,6 +190,12 @@ class MemDb(object):
                 elif k == 'trust_indicator.current':
                     if content.get('trust_indicator').get('current') != v:
                         return False
+                elif k == '$or':
+                    if not any(self._in_others(content, sub) for sub in v):
+                        return False
+                elif isinstance(v, dict) and '$in' in v:
+                    if content.get(k) not in v['$in']:
+                        return False
                 elif not isinstance(v, dict) and content.get(k, None) != v:
                     return False
         return True
@@ -202,7 +208,8 @@ class MemDb(object):
 
         return res
 
-    def find(self, *args):
+    def find(self, spec=None, projection=None):
+        args = (spec,) if spec is not None else ()
         return MemCursor(self._find(*args))
 
     def _aggregate(self, *args, **kwargs):
@@ -211,7 +218,11 @@ class MemDb(object):
         for arg in args[0]:
             for k, v in arg.iteritems():
                 if k == '$match':
+                    if '_id' in v:
+                        v = dict(v, _id=str(v['_id']))
                     res = self._find(v)
+                elif k == '$lookup':
+                    res = self._lookup(res, v)
         cursor = MemCursor(res)
         for arg in args[0]:
             for k, v in arg.iteritems():
@@ -223,6 +234,18 @@ class MemDb(object):
                     cursor = cursor.limit(v)
         return cursor
 
+    @staticmethod
+    def _lookup(contents, spec):
+        foreign = globals()[spec['from']].contents
+        res = []
+        for content in contents:
+            local = content.get(spec['localField'])
+            content = dict(content)
+            content[spec['as']] = [f for f in foreign
+                                   if f.get(spec['foreignField']) == local]
+            res.append(content)
+        return res
+
     def aggregate(self, *args, **kwargs):
         return self._aggregate(*args, **kwargs)
 
@@ -282,3 +305,6 @@ testcases = MemDb('testcases')
 results = MemDb('results')
 scenarios = MemDb('scenarios')
 tokens = MemDb('tokens')
+tests = MemDb('tests')
+applications = MemDb('applications')
+users = MemDb('users')
@@ -159,3 +159,6 @@ class TestBase(testing.AsyncHTTPTestCase):
         fake_pymongo.testcases.clear()
         fake_pymongo.results.clear()
         fake_pymongo.scenarios.clear()
+        fake_pymongo.tests.clear()
+        fake_pymongo.applications.clear()
+        fake_pymongo.users.clear()
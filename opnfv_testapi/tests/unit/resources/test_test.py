@@ -0,0 +1,286 @@
+##############################################################################
+# Copyright (c) 2019 opnfv.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+import httplib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from bson import objectid
+from tornado import web
+
+from opnfv_testapi.common import message
+from opnfv_testapi.tests.unit import fake_pymongo
+from opnfv_testapi.tests.unit.resources import test_base as base
+
+
+class TestTestUpdate(base.TestBase):
+    def setUp(self):
+        super(TestTestUpdate, self).setUp()
+        from opnfv_testapi.resources import test_handlers
+        self.handlers = test_handlers
+        self.basePath = '/api/v1/tests'
+        self.test_id = str(objectid.ObjectId())
+        fake_pymongo.tests.insert({'_id': self.test_id,
+                                   'id': 'test-1',
+                                   'owner': 'user1',
+                                   'status': 'private'})
+        fake_pymongo.users.insert({'openid': 'user1',
+                                   'email': 'user1@example.com'})
+        fake_pymongo.users.insert({'openid': 'user2',
+                                   'email': 'user2@example.com'})
+
+    def _put_as(self, openid, body, role=None):
+        cookies = {'openid': openid}
+        if role is not None:
+            cookies['role'] = role
+        headers = dict(self.headers)
+        headers['Cookie'] = '; '.join(
+            '{}={}'.format(k, web.create_signed_value('opnfv-testapi', k, v))
+            for k, v in cookies.items())
+        res = self.fetch(self._get_uri(self.test_id),
+                         method='PUT',
+                         body=json.dumps(body),
+                         headers=headers)
+        return res.code, json.loads(res.body)
+
+    def test_reviewAlreadySubmitted(self):
+        fake_pymongo.tests.insert({'_id': objectid.ObjectId(),
+                                   'id': 'test-1',
+                                   'owner': 'user2',
+                                   'status': 'review'})
+        code, body = self._put_as('user1',
+                                  {'item': 'status', 'status': 'review'})
+        self.assertEqual(httplib.OK, code)
+        self.assertEqual(403, body['code'])
+        self.assertEqual('user2 has already submitted one record with the '
+                         'same Test ID: test-1', body['msg'])
+
+    def _add_reviewed_test(self):
+        test_id = str(objectid.ObjectId())
+        fake_pymongo.tests.insert({'_id': test_id,
+                                   'id': 'test-2',
+                                   'owner': 'user2',
+                                   'status': 'review'})
+        return test_id
+
+    def test_verifyByAdministratorCookie(self):
+        self.test_id = self._add_reviewed_test()
+        code, body = self._put_as('user1',
+                                  {'item': 'status', 'status': 'verified'},
+                                  role='user,administrator')
+        self.assertEqual(httplib.OK, code)
+        self.assertNotIn('code', body)
+        self.assertEqual('verified', body['status'])
+
+    def test_verifyWithoutAdministratorCookie(self):
+        self.test_id = self._add_reviewed_test()
+        with mock.patch.object(self.handlers.GenericTestHandler,
+                               '_current_user') as current_user:
+            code, body = self._put_as('user1',
+                                      {'item': 'status',
+                                       'status': 'verified'},
+                                      role='')
+        self.assertEqual(httplib.OK, code)
+        self.assertEqual('404', body['code'])
+        self.assertEqual(message.no_auth(), body['msg'])
+        self.assertFalse(current_user.called)
+
+    def test_verifyWithoutRoleCookie(self):
+        self.test_id = self._add_reviewed_test()
+        fake_pymongo.users.update({'openid': 'user1'},
+                                  {'role': 'administrator'})
+        code, body = self._put_as('user1',
+                                  {'item': 'status', 'status': 'verified'})
+        self.assertEqual(httplib.OK, code)
+        self.assertEqual('verified', body['status'])
+        code, body = self._put_as('user2',
+                                  {'item': 'status', 'status': 'verified'})
+        self.assertEqual('404', body['code'])
+        self.assertEqual(message.no_auth(), body['msg'])
+
+    def test_shareByEmail(self):
+        code, body = self._put_as('user1', {'item': 'shared',
+                                            'shared': ['user2@example.com']})
+        self.assertEqual(httplib.OK, code)
+        self.assertNotIn('code', body)
+        self.assertEqual(['user2@example.com'], body['shared'])
+
+    def test_shareUnknownUser(self):
+        code, body = self._put_as('user1', {'item': 'shared',
+                                            'shared': ['user3']})
+        self.assertEqual(httplib.OK, code)
+        self.assertEqual('403', body['code'])
+        self.assertIn('Data does not exist', body['msg'])
+
+    def test_shareSameUserTwice(self):
+        code, body = self._put_as('user1',
+                                  {'item': 'shared',
+                                   'shared': ['user2@example.com', 'user2',
+                                              'user3']})
+        self.assertEqual(httplib.OK, code)
+        self.assertEqual('403', body['code'])
+        self.assertEqual('Already shared with this user', body['msg'])
+
+
+class TestValidationBase(object):
+    def _patch_paths(self):
+        # config is only loadable once TestBase has patched it
+        from opnfv_testapi.resources import test_handlers
+        self.handlers = test_handlers
+        self.logs = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.logs)
+        results = os.path.join(self.logs, '{}', 'results')
+        for name, path in (
+                ('DOVETAIL_RESULTS_PATH', 'results.json'),
+                ('DOVETAIL_LOG_PATH', 'dovetail.log')):
+            patcher = mock.patch.object(self.handlers, name,
+                                        os.path.join(results, path))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.handlers._VALIDATION_CACHE.clear()
+        self.addCleanup(self.handlers._VALIDATION_CACHE.clear)
+
+    def _write(self, test_id, name, content):
+        path = os.path.join(self.logs, test_id, 'results')
+        if not os.path.exists(path):
+            os.makedirs(path)
+        path = os.path.join(path, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def _write_results(self, test_id, content):
+        if isinstance(content, dict):
+            content = json.dumps(content)
+        return self._write(test_id, 'results.json', content)
+
+    def _write_log(self, test_id, content):
+        return self._write(test_id, 'dovetail.log', content)
+
+
+class TestValidation(TestValidationBase, base.TestBase):
+    enabled = 'API response validation enabled'
+    disabled = 'API response validation disabled'
+
+    def setUp(self):
+        super(TestValidation, self).setUp()
+        self._patch_paths()
+
+    def test_resultsEnabled(self):
+        self._write_results('t1', {'validation': 'enabled'})
+        self.assertEqual(self.enabled,
+                         self.handlers._resolve_validation('t1'))
+
+    def test_resultsOtherValue(self):
+        self._write_results('t1', {'validation': 'disabled'})
+        self._write_results('t2', {'validation': None})
+        self.assertEqual(self.disabled,
+                         self.handlers._resolve_validation('t1'))
+        self.assertEqual(self.disabled,
+                         self.handlers._resolve_validation('t2'))
+
+    def test_resultsNoKeyFallsBackToLog(self):
+        self._write_results('t1', {'testcases': []})
+        self._write_log('t1', 'Strict API response validation DISABLED')
+        self.assertEqual(self.disabled,
+                         self.handlers._resolve_validation('t1'))
+
+    def test_resultsInvalidFallsBackToLog(self):
+        self._write_results('t1', '{not json')
+        self._write_log('t1', 'all good')
+        self.assertEqual(self.enabled,
+                         self.handlers._resolve_validation('t1'))
+
+    def test_logEmpty(self):
+        self._write_log('t1', '')
+        self.assertEqual(self.enabled,
+                         self.handlers._resolve_validation('t1'))
+
+    def test_logWithKeyword(self):
+        self._write_log('t1', 'a\nStrict API response validation DISABLED\nb')
+        self.assertEqual(self.disabled,
+                         self.handlers._resolve_validation('t1'))
+
+    def test_logWithoutKeyword(self):
+        self._write_log('t1', 'Strict API response validation ENABLED')
+        self.assertEqual(self.enabled,
+                         self.handlers._resolve_validation('t1'))
+
+    def test_bothMissing(self):
+        self.assertIsNone(self.handlers._resolve_validation('t1'))
+
+    def test_searchFile(self):
+        path = self._write_log('t1', 'x Strict API response validation '
+                                     'DISABLED y')
+        with open(path, 'rb') as f:
+            self.assertTrue(self.handlers._search_file(
+                f, self.handlers._VALIDATION_DISABLED))
+            self.assertFalse(self.handlers._search_file(f, b'missing'))
+
+    def test_readValidationSkipsMissingStat(self):
+        self._write_results('t1', {'validation': 'enabled'})
+        self.assertIsNone(self.handlers._read_validation('t1', None, None))
+
+    def test_cacheHitSameMtime(self):
+        path = self._write_results('t1', {'validation': 'enabled'})
+        os.utime(path, (1000, 1000))
+        self.assertEqual(self.enabled,
+                         self.handlers._resolve_validation('t1'))
+        self._write_results('t1', {'validation': 'disabled'})
+        os.utime(path, (1000, 1000))
+        with mock.patch.object(self.handlers, '_read_validation') as read:
+            self.assertEqual(self.enabled,
+                             self.handlers._resolve_validation('t1'))
+            self.assertFalse(read.called)
+
+    def test_cacheMissMtimeChanged(self):
+        path = self._write_results('t1', {'validation': 'enabled'})
+        os.utime(path, (1000, 1000))
+        self.assertEqual(self.enabled,
+                         self.handlers._resolve_validation('t1'))
+        self._write_results('t1', {'validation': 'disabled'})
+        os.utime(path, (2000, 2000))
+        self.assertEqual(self.disabled,
+                         self.handlers._resolve_validation('t1'))
+
+
+class TestTestGet(TestValidationBase, base.TestBase):
+    def setUp(self):
+        super(TestTestGet, self).setUp()
+        self._patch_paths()
+        self.basePath = '/api/v1/tests'
+        self.test_id = str(objectid.ObjectId())
+        fake_pymongo.tests.insert({'_id': self.test_id,
+                                   'id': 't1',
+                                   'owner': 'user1',
+                                   'status': 'private'})
+
+    def test_validationAdded(self):
+        self._write_results('t1', {'validation': 'enabled'})
+        res = self.fetch(self._get_uri(self.test_id),
+                         method='GET',
+                         headers=self.headers)
+        self.assertEqual(httplib.OK, res.code)
+        self.assertEqual('API response validation enabled',
+                         json.loads(res.body)['validation'])
+
+    def test_bothMissingForbidden(self):
+        res = self.fetch(self._get_uri(self.test_id),
+                         method='GET',
+                         headers=self.headers)
+        self.assertEqual(httplib.FORBIDDEN, res.code)
+        self.assertIn('neither results.json nor dovetail.log are found',
+                      res.body)
+
+
+if __name__ == '__main__':
+    unittest.main()